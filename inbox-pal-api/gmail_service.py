@@ -1,12 +1,17 @@
 # inbox-pal-api/gmail_service.py
 import os
 import json
+import hashlib
+from contextlib import closing
+import threading
+from collections import OrderedDict
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from fastapi import HTTPException
 import logging
-from google.auth.transport.requests import Request
+import http_transport
+import search_index
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +21,13 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.metadata'
 ]
 
+# Small LRU mapping token hashes to the Gmail address they belong to, so the
+# search index can be picked without a profile lookup on every request.
+# Keyed on a hash so raw bearer tokens are never held here.
+USER_EMAIL_CACHE_SIZE = 256
+_user_email_cache = OrderedDict()
+_user_email_cache_lock = threading.Lock()
+
 # Load the credentials from file
 try:
     with open('oauth_credentials.json', 'r') as f:
@@ -65,6 +77,10 @@ def exchange_code_for_token(code):
         logger.error(f"Error exchanging code for token: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Error getting access token: {str(e)}")
 
+def build_gmail_client(credentials):
+    """Build a Gmail client that sends through the shared pooled transport."""
+    return build('gmail', 'v1', http=http_transport.authorized_http(credentials), cache_discovery=False)
+
 def build_gmail_service(credentials_dict):
     """Build and return a Gmail service object."""
     try:
@@ -77,7 +93,7 @@ def build_gmail_service(credentials_dict):
             scopes=credentials_dict["scopes"]
         )
         
-        return build('gmail', 'v1', credentials=credentials)
+        return build_gmail_client(credentials)
     except Exception as e:
         logger.error(f"Error building Gmail service: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error accessing Gmail API: {str(e)}")
@@ -102,15 +118,15 @@ def build_gmail_service_with_token(token, refresh_token=None):
         # Check if token is expired and refresh if possible
         if credentials.expired and credentials.refresh_token:
             logger.info("Token expired, attempting to refresh...")
-            credentials.refresh(Request())
+            credentials.refresh(http_transport.refresh_request())
             logger.info("Token refreshed successfully")
-            return build('gmail', 'v1', credentials=credentials), credentials.token
+            return build_gmail_client(credentials), credentials.token
         elif credentials.expired and not credentials.refresh_token:
             logger.error("Token expired and no refresh token available")
             raise HTTPException(status_code=401, detail="Token expired. Please re-authenticate.")
         
         logger.info(f"Building Gmail service with token starting with: {token[:10]}...")
-        service = build('gmail', 'v1', credentials=credentials)
+        service = build_gmail_client(credentials)
         return service, token
         
     except Exception as e:
@@ -139,6 +155,75 @@ def get_unread_count(service):
             raise HTTPException(status_code=401, detail="Token expired. Please re-authenticate.")
         raise HTTPException(status_code=500, detail=f"Error fetching unread emails: {str(e)}")
 
+def get_user_email(service, token):
+    """Get the Gmail address for a token, caching it per token."""
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    with _user_email_cache_lock:
+        if key in _user_email_cache:
+            _user_email_cache.move_to_end(key)
+            return _user_email_cache[key]
+    
+    profile = service.users().getProfile(userId='me').execute()
+    user_email = profile['emailAddress']
+    
+    with _user_email_cache_lock:
+        _user_email_cache[key] = user_email
+        _user_email_cache.move_to_end(key)
+        while len(_user_email_cache) > USER_EMAIL_CACHE_SIZE:
+            _user_email_cache.popitem(last=False)
+    return user_email
+
+def get_email_metadata(service, message_id):
+    """Get basic metadata for a single email."""
+    msg = service.users().messages().get(
+        userId='me',
+        id=message_id,
+        format='metadata',
+        metadataHeaders=['From', 'Subject', 'Date']
+    ).execute()
+    return parse_email_metadata(msg)
+
+def parse_email_metadata(msg):
+    """Turn a metadata-format Gmail message into our email dict."""
+    # Check if 'UNREAD' is in the labelIds
+    is_unread = 'UNREAD' in msg.get('labelIds', [])
+    
+    headers = msg['payload']['headers']
+    return {
+        'id': msg['id'],
+        'snippet': msg.get('snippet', ''),
+        'from': next((h['value'] for h in headers if h['name'] == 'From'), ''),
+        'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), ''),
+        'date': next((h['value'] for h in headers if h['name'] == 'Date'), ''),
+        'unread': is_unread
+    }
+
+def get_emails_metadata(service, message_ids):
+    """Get basic metadata for several emails in one batch request."""
+    emails = {}
+    
+    def handle_message(request_id, response, exception):
+        if exception is not None:
+            logger.warning(f"Error fetching email {request_id}: {str(exception)}")
+            return
+        emails[request_id] = parse_email_metadata(response)
+    
+    # Gmail accepts up to 100 calls per batch; callers stay well below that
+    batch = service.new_batch_http_request(callback=handle_message)
+    for message_id in message_ids:
+        batch.add(
+            service.users().messages().get(
+                userId='me',
+                id=message_id,
+                format='metadata',
+                metadataHeaders=['From', 'Subject', 'Date']
+            ),
+            request_id=message_id
+        )
+    batch.execute()
+    
+    return [emails[message_id] for message_id in message_ids if message_id in emails]
+
 def get_recent_emails(service, max_results=5):
     """Get recent emails with basic metadata."""
     try:
@@ -152,27 +237,7 @@ def get_recent_emails(service, max_results=5):
         email_list = []
         
         for message in messages:
-            msg = service.users().messages().get(
-                userId='me',
-                id=message['id'],
-                format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
-            
-            # Check if 'UNREAD' is in the labelIds
-            is_unread = 'UNREAD' in msg.get('labelIds', [])
-            
-            headers = msg['payload']['headers']
-            email_data = {
-                'id': msg['id'],
-                'snippet': msg.get('snippet', ''),
-                'from': next((h['value'] for h in headers if h['name'] == 'From'), ''),
-                'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), ''),
-                'date': next((h['value'] for h in headers if h['name'] == 'Date'), ''),
-                'unread': is_unread
-            }
-            
-            email_list.append(email_data)
+            email_list.append(get_email_metadata(service, message['id']))
         
         logger.info(f"Successfully retrieved {len(email_list)} recent emails")
         return email_list
@@ -182,6 +247,65 @@ def get_recent_emails(service, max_results=5):
             raise HTTPException(status_code=401, detail="Token expired. Please re-authenticate.")
         raise HTTPException(status_code=500, detail=f"Error fetching recent emails: {str(e)}")
     
+def index_fetched_emails(service, token, emails):
+    """Add fetched emails to the user's search index without failing the request."""
+    try:
+        user_email = get_user_email(service, token)
+        with closing(search_index.connect(user_email)) as conn:
+            search_index.index_messages(conn, emails)
+    except Exception as e:
+        logger.warning(f"Could not index emails for search: {str(e)}")
+
+def search_emails(service, token, query, max_results=10, remote=False):
+    """Search already-fetched emails locally, falling back to Gmail search.
+    
+    Gmail is only asked when nothing indexed matches, or when the caller
+    sets remote=True to look beyond the messages fetched so far.
+    """
+    try:
+        terms = search_index.extract_terms(query)
+        if not terms:
+            return {'emails': [], 'source': 'local'}
+        
+        user_email = get_user_email(service, token)
+        with closing(search_index.connect(user_email)) as conn:
+            results = search_index.search(conn, terms, max_results)
+            if results and not remote:
+                logger.info(f"Found {len(results)} emails in local index")
+                return {'emails': results, 'source': 'local'}
+            
+            return _search_gmail(service, conn, terms, results, max_results)
+    except Exception as e:
+        logger.error(f"Error searching emails: {str(e)}")
+        # A revoked or expired token surfaces as a 401 HttpError from the API
+        is_unauthorized = getattr(getattr(e, 'resp', None), 'status', None) == 401
+        if is_unauthorized or "invalid_grant" in str(e) or "Token has been expired" in str(e) or "invalid_token" in str(e):
+            raise HTTPException(status_code=401, detail="Token expired. Please re-authenticate.")
+        raise HTTPException(status_code=500, detail=f"Error searching emails: {str(e)}")
+
+def _search_gmail(service, conn, terms, results, max_results):
+    """Run a Gmail search, indexing only the matches we haven't fetched yet."""
+    response = service.users().messages().list(
+        userId='me',
+        q=' '.join(terms),
+        maxResults=max_results
+    ).execute()
+    
+    message_ids = [message['id'] for message in response.get('messages', [])]
+    indexed_ids = search_index.get_indexed_ids(conn, message_ids)
+    new_ids = [message_id for message_id in message_ids if message_id not in indexed_ids]
+    new_emails = get_emails_metadata(service, new_ids) if new_ids else []
+    search_index.index_messages(conn, new_emails)
+    
+    # Local hits keep their ranking; Gmail matches not already found follow in Gmail's order
+    local_ids = {email['id'] for email in results}
+    extra_ids = [message_id for message_id in message_ids if message_id not in local_ids]
+    extra = search_index.get_messages(conn, extra_ids)[:max_results - len(results)]
+    logger.info(f"Found {len(results)} emails locally and {len(extra)} via Gmail search ({len(new_emails)} newly indexed)")
+    
+    source = 'local+gmail' if results else 'gmail'
+    return {'emails': results + extra, 'source': source}
+    
 # Add this function to gmail_service.py
 def rank_emails_by_importance(service, max_results=10):
     """Get emails and rank them by importance using AI."""
@@ -0,0 +1,280 @@
+import os
+import socket
+import logging
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import Request
+
+logger = logging.getLogger(__name__)
+
+# Pool settings, overridable from the environment. POOL_SIZE is a hard cap per
+# host: when every connection is busy, requests wait for one to be returned.
+POOL_SIZE = int(os.getenv("GMAIL_HTTP_POOL_SIZE", "20"))
+# Number of per-host pools kept by urllib3 (Gmail API, OAuth token endpoint, ...)
+POOL_CONNECTIONS = int(os.getenv("GMAIL_HTTP_POOL_CONNECTIONS", "10"))
+CONNECT_TIMEOUT = float(os.getenv("GMAIL_HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("GMAIL_HTTP_READ_TIMEOUT", "30"))
+# Idle connection lifetime; only applies to the HTTP/2 (httpx) client, since
+# urllib3 has no idle timeout and keeps connections until the server closes them
+KEEPALIVE_EXPIRY = float(os.getenv("GMAIL_HTTP_KEEPALIVE_EXPIRY", "60"))
+ENABLE_HTTP2 = os.getenv("GMAIL_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Same refresh behaviour as google_auth_httplib2.AuthorizedHttp
+REFRESH_STATUS_CODES = (401,)
+MAX_REFRESH_ATTEMPTS = 2
+
+# Hosts serving OAuth token refreshes, reported apart from Gmail API traffic
+TOKEN_HOSTS = {"oauth2.googleapis.com", "accounts.google.com"}
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose urllib3 pools report every request and new connection.
+
+    Counts are pushed to a callback as they happen, so they survive the pool
+    manager evicting idle per-host pools.
+    """
+
+    def __init__(self, on_event, **kwargs):
+        self._on_event = on_event
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self._counting_pool(pool_cls)
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def _counting_pool(self, pool_cls):
+        on_event = self._on_event
+
+        class CountingPool(pool_cls):
+            def _new_conn(self):
+                on_event(self.host, "connections")
+                return super()._new_conn()
+
+            def urlopen(self, *args, **kwargs):
+                on_event(self.host, "requests")
+                return super().urlopen(*args, **kwargs)
+
+        return CountingPool
+
+
+class PooledTransport:
+    """Process-wide, thread-safe connection pool shared by every Gmail request.
+
+    API calls go through an HTTP/2 capable httpx client when GMAIL_HTTP2 is set
+    and httpx/h2 are installed, otherwise through a requests session backed by
+    a urllib3 pool. The requests session is always kept for OAuth token refreshes.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, pool_connections=POOL_CONNECTIONS,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 enable_http2=ENABLE_HTTP2):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Running totals per host: {"requests": n, "connections": n}
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"requests": 0, "connections": 0})
+
+        self.session = requests.Session()
+        adapter = CountingHTTPAdapter(
+            self._record,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_size,
+            pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.client = None
+        if enable_http2:
+            self.client = self._create_http2_client(pool_size, connect_timeout, read_timeout)
+
+    def _create_http2_client(self, pool_size, connect_timeout, read_timeout):
+        try:
+            import httpx
+            client = httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                )
+            )
+            logger.info("Using HTTP/2 transport for Gmail API calls")
+            return client
+        except ImportError as e:
+            logger.warning(f"HTTP/2 requested but unavailable ({str(e)}), falling back to HTTP/1.1 pool")
+            return None
+
+    @property
+    def protocol(self):
+        return "HTTP/2" if self.client is not None else "HTTP/1.1"
+
+    def _record(self, host, counter):
+        with self._lock:
+            self._counts[host][counter] += 1
+
+    def _send_http2(self, method, uri, body, headers):
+        import httpx
+
+        host = urlsplit(uri).hostname
+
+        def trace(event_name, info):
+            # Fires once per newly opened TCP connection
+            if event_name == "connection.connect_tcp.complete":
+                self._record(host, "connections")
+
+        self._record(host, "requests")
+        try:
+            response = self.client.request(
+                method, uri, content=body, headers=headers,
+                extensions={"trace": trace}
+            )
+        except httpx.TimeoutException as e:
+            raise socket.timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+        return response, response.status_code, response.reason_phrase
+
+    def _send_http1(self, method, uri, body, headers):
+        try:
+            response = self.session.request(
+                method, uri, data=body, headers=headers, timeout=self.timeout
+            )
+        except requests.exceptions.Timeout as e:
+            raise socket.timeout(str(e)) from e
+        except requests.exceptions.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+        return response, response.status_code, response.reason
+
+    def send(self, method, uri, body=None, headers=None):
+        """Send a request over the pool and return an (httplib2.Response, bytes) pair.
+
+        Transport failures are raised as socket.timeout / ConnectionError on both
+        protocols, which is what googleapiclient's retry logic expects.
+        """
+        if self.client is not None:
+            response, status, reason = self._send_http2(method, uri, body, headers)
+        else:
+            response, status, reason = self._send_http1(method, uri, body, headers)
+
+        content = response.content
+        info = {name.lower(): value for name, value in response.headers.items()}
+        # Body is already decompressed, so mirror what httplib2 does with the headers
+        if "content-encoding" in info:
+            info["-content-encoding"] = info.pop("content-encoding")
+            info["content-length"] = str(len(content))
+        info["status"] = str(status)
+
+        resp = httplib2.Response(info)
+        resp.reason = reason
+        return resp, content
+
+    @staticmethod
+    def _summarize(requests_made, connections):
+        reused = max(requests_made - connections, 0)
+        return {
+            "requests": requests_made,
+            "new_connections": connections,
+            "reused_connections": reused,
+            "reuse_rate": round(reused / requests_made, 4) if requests_made else 0.0
+        }
+
+    def stats(self):
+        """Return running request/connection totals and reuse rates.
+
+        Gmail API calls and OAuth token refreshes are reported separately.
+        """
+        totals = {"gmail_api": [0, 0], "token_endpoint": [0, 0]}
+        with self._lock:
+            for host, counts in self._counts.items():
+                group = "token_endpoint" if host in TOKEN_HOSTS else "gmail_api"
+                totals[group][0] += counts["requests"]
+                totals[group][1] += counts["connections"]
+
+        return {
+            "protocol": self.protocol,
+            "pool_size": self.pool_size,
+            "gmail_api": self._summarize(*totals["gmail_api"]),
+            "token_endpoint": self._summarize(*totals["token_endpoint"])
+        }
+
+
+class AuthorizedPooledHttp:
+    """httplib2-compatible object that googleapiclient can use as its `http`.
+
+    Holds one user's credentials and sends through the shared PooledTransport,
+    so building a service per request no longer opens new TLS connections.
+    """
+
+    def __init__(self, credentials, transport):
+        self.credentials = credentials
+        self.transport = transport
+        self._refresh_request = Request(session=transport.session)
+        self._refresh_lock = threading.Lock()
+
+    def request(self, uri, method="GET", body=None, headers=None,
+                redirections=None, connection_type=None, **kwargs):
+        _credential_refresh_attempt = kwargs.pop("_credential_refresh_attempt", 0)
+        request_headers = dict(headers) if headers is not None else {}
+
+        with self._refresh_lock:
+            self.credentials.before_request(self._refresh_request, method, uri, request_headers)
+
+        resp, content = self.transport.send(method, uri, body=body, headers=request_headers)
+
+        if (resp.status in REFRESH_STATUS_CODES
+                and _credential_refresh_attempt < MAX_REFRESH_ATTEMPTS
+                and self.credentials.refresh_token):
+            logger.info(f"Refreshing credentials due to a {resp.status} response")
+            with self._refresh_lock:
+                self.credentials.refresh(self._refresh_request)
+            return self.request(
+                uri, method=method, body=body, headers=headers,
+                _credential_refresh_attempt=_credential_refresh_attempt + 1
+            )
+
+        return resp, content
+
+    def close(self):
+        """No-op: the underlying pool is shared and outlives any single service."""
+        pass
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Return the process-wide PooledTransport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = PooledTransport()
+                logger.info(f"Created pooled HTTP transport (pool size {POOL_SIZE}, {_transport.protocol})")
+    return _transport
+
+
+def authorized_http(credentials):
+    """Wrap credentials in an httplib2-compatible object backed by the shared pool."""
+    return AuthorizedPooledHttp(credentials, get_transport())
+
+
+def refresh_request():
+    """google.auth Request that refreshes tokens over the shared pool."""
+    return Request(session=get_transport().session)
+
+
+def get_transport_stats():
+    """Connection reuse statistics for the shared transport."""
+    return get_transport().stats()
@@ -9,6 +9,8 @@ from pydantic import BaseModel, Field
 import json
 from fastapi.responses import RedirectResponse
 import gmail_service
+import http_transport
+import search_index
 
 
 # Set up logging
@@ -240,6 +242,7 @@ async def get_recent_emails(credentials: GmailCredentials):
     try:
         service = gmail_service.build_gmail_service(credentials.dict())
         emails = gmail_service.get_recent_emails(service)
+        gmail_service.index_fetched_emails(service, credentials.token, emails)
         return {"emails": emails}
     except Exception as e:
         logger.error(f"Error getting recent emails: {str(e)}")
@@ -258,6 +261,7 @@ async def get_recent_emails_simple(data: dict):
         
         service, current_token = gmail_service.build_gmail_service_with_token(token, refresh_token)
         emails = gmail_service.get_recent_emails(service)
+        gmail_service.index_fetched_emails(service, current_token, emails)
         
         result = {"emails": emails}
         
@@ -291,6 +295,7 @@ async def process_command(command: TextCommand):
                     - NEXT_EMAIL: User wants the next email (e.g., "next", "next email", "continue")
                     - SKIP_EMAIL: User wants to skip current email (e.g., "skip", "skip this")
                     - MORE_DETAILS: User wants more details about current email (e.g., "tell me more", "read the full email")
+                    - SEARCH_EMAILS: User wants to find specific emails (e.g., "find the email from Dana about the invoice")
                     - STOP: User wants to stop (e.g., "stop", "that's enough", "done")
                     - OTHER: Anything else
                     
@@ -305,16 +310,58 @@ async def process_command(command: TextCommand):
         intent = intent_response.choices[0].message.content.strip()
         logger.info(f"Detected intent: {intent}")
         
-        return {
+        result = {
             "intent": intent,
             "original_command": command.text,
             "response": f"I understand you want to: {intent.lower().replace('_', ' ')}"
         }
         
+        # Pull the search terms out of the spoken command for /api/gmail/search
+        if intent == "SEARCH_EMAILS":
+            result["search_query"] = ' '.join(search_index.extract_terms(command.text))
+        
+        return result
+        
     except Exception as e:
         logger.error(f"Error processing command: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/api/gmail/search")
+async def search_emails(data: dict):
+    """Search fetched emails, falling back to Gmail for messages not yet indexed."""
+    try:
+        token = data.get("token")
+        refresh_token = data.get("refresh_token")  # Optional
+        query = data.get("query")
+        remote = bool(data.get("remote", False))  # Optional, also search Gmail when local hits exist
+        
+        if not token:
+            raise HTTPException(status_code=400, detail="Token is required")
+        if not query:
+            raise HTTPException(status_code=400, detail="Query is required")
+        
+        try:
+            max_results = int(data.get("max_results", 10))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="max_results must be an integer")
+        max_results = max(1, min(max_results, 50))
+        
+        service, current_token = gmail_service.build_gmail_service_with_token(token, refresh_token)
+        result = gmail_service.search_emails(service, current_token, query, max_results, remote)
+        
+        # If token was refreshed, return the new token
+        if current_token != token:
+            result['new_token'] = current_token
+            logger.info("Token was refreshed, returning new token")
+        
+        return result
+    except HTTPException as http_error:
+        logger.error(f"HTTP Error in search: {str(http_error)}")
+        raise http_error
+    except Exception as e:
+        logger.error(f"Unexpected error searching emails: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching emails: {str(e)}")
+    
 @app.post("/api/gmail/ranked-emails")
 async def get_ranked_emails(data: dict):
     """Get emails ranked by importance."""
@@ -325,6 +372,7 @@ async def get_ranked_emails(data: dict):
         
         service, current_token = gmail_service.build_gmail_service_with_token(token)
         ranked_emails = gmail_service.rank_emails_by_importance(service)
+        gmail_service.index_fetched_emails(service, current_token, ranked_emails)
         
         result = {"emails": ranked_emails}
         if current_token != token:
@@ -373,6 +421,15 @@ async def summarize_email(data: dict):
         logger.error(f"Error summarizing email: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/gmail/transport-stats")
+async def get_transport_stats():
+    """Report connection reuse for the shared Gmail HTTP transport."""
+    try:
+        return http_transport.get_transport_stats()
+    except Exception as e:
+        logger.error(f"Error getting transport stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
 @app.get("/api/health")
 async def health_check():
@@ -0,0 +1,183 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# One SQLite database per user lives in this directory
+INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", "search_index")
+
+# Filler words from voice commands that should not become search terms
+STOPWORDS = {
+    'a', 'about', 'an', 'and', 'any', 'by', 'can', 'could', 'email', 'emails',
+    'find', 'for', 'from', 'get', 'give', 'i', 'in', 'is', 'it', 'look', 'me',
+    'message', 'messages', 'mail', 'my', 'of', 'on', 'please', 'regarding',
+    'search', 'sent', 'show', 'that', 'the', 'to', 'up', 'was', 'what', 'where',
+    'which', 'with', 'you'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT UNIQUE NOT NULL,
+    sender TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    snippet TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    unread INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+    subject, sender, snippet, body,
+    content='emails', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS emails_ai AFTER INSERT ON emails BEGIN
+    INSERT INTO emails_fts(rowid, subject, sender, snippet, body)
+    VALUES (new.id, new.subject, new.sender, new.snippet, new.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS emails_ad AFTER DELETE ON emails BEGIN
+    INSERT INTO emails_fts(emails_fts, rowid, subject, sender, snippet, body)
+    VALUES ('delete', old.id, old.subject, old.sender, old.snippet, old.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS emails_au AFTER UPDATE ON emails BEGIN
+    INSERT INTO emails_fts(emails_fts, rowid, subject, sender, snippet, body)
+    VALUES ('delete', old.id, old.subject, old.sender, old.snippet, old.body);
+    INSERT INTO emails_fts(rowid, subject, sender, snippet, body)
+    VALUES (new.id, new.subject, new.sender, new.snippet, new.body);
+END;
+"""
+
+# A metadata-only fetch must not wipe a body stored by an earlier full fetch
+UPSERT_SQL = """
+INSERT INTO emails (message_id, sender, subject, snippet, body, date, unread)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(message_id) DO UPDATE SET
+    sender = excluded.sender,
+    subject = excluded.subject,
+    snippet = CASE WHEN excluded.snippet != '' THEN excluded.snippet ELSE emails.snippet END,
+    body = CASE WHEN excluded.body != '' THEN excluded.body ELSE emails.body END,
+    date = excluded.date,
+    unread = excluded.unread
+"""
+
+# bm25 column weights follow the FTS column order: subject, sender, snippet, body
+SEARCH_SQL = """
+SELECT e.message_id, e.sender, e.subject, e.snippet, e.date, e.unread
+FROM emails_fts
+JOIN emails e ON e.id = emails_fts.rowid
+WHERE emails_fts MATCH ?
+ORDER BY bm25(emails_fts, 10.0, 8.0, 2.0, 1.0)
+LIMIT ?
+"""
+
+
+# Database paths whose schema has already been created in this process
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def _db_path(user_email):
+    safe_name = re.sub(r'[^A-Za-z0-9_.@-]', '_', user_email.lower())
+    return os.path.join(INDEX_DIR, f"{safe_name}.db")
+
+
+def connect(user_email):
+    """Open the user's index, creating its schema the first time it is used.
+
+    Callers should reuse the connection for every index operation in a
+    request and close it when done.
+    """
+    path = _db_path(user_email)
+    if path not in _initialized_paths:
+        with _init_lock:
+            if path not in _initialized_paths:
+                os.makedirs(INDEX_DIR, exist_ok=True)
+                with sqlite3.connect(path) as conn:
+                    conn.executescript(SCHEMA)
+                conn.close()
+                _initialized_paths.add(path)
+    return sqlite3.connect(path)
+
+
+def _row_to_email(row):
+    return {
+        'id': row[0],
+        'from': row[1],
+        'subject': row[2],
+        'snippet': row[3],
+        'date': row[4],
+        'unread': bool(row[5])
+    }
+
+
+def extract_terms(text):
+    """Turn a spoken or typed query into search terms, dropping filler words."""
+    words = re.findall(r"\w+", text.lower())
+    return [w for w in words if w not in STOPWORDS]
+
+
+def build_match_query(terms):
+    """Build an FTS5 MATCH expression requiring every term, each as a prefix."""
+    return ' AND '.join('"{}"*'.format(t.replace('"', '""')) for t in terms)
+
+
+def index_messages(conn, emails):
+    """Add or update fetched emails in the user's index."""
+    if not emails:
+        return 0
+
+    rows = [
+        (
+            email['id'],
+            email.get('from', ''),
+            email.get('subject', ''),
+            email.get('snippet') or email.get('body', '')[:200],
+            email.get('full_body') or email.get('body', ''),
+            email.get('date', ''),
+            int(bool(email.get('unread', False)))
+        )
+        for email in emails
+    ]
+
+    with conn:
+        conn.executemany(UPSERT_SQL, rows)
+
+    logger.info(f"Indexed {len(rows)} emails for search")
+    return len(rows)
+
+
+def search(conn, terms, max_results=10):
+    """Search the user's local index and return matching emails, best first."""
+    if not terms:
+        return []
+
+    rows = conn.execute(SEARCH_SQL, (build_match_query(terms), max_results)).fetchall()
+    return [_row_to_email(row) for row in rows]
+
+
+def get_messages(conn, message_ids):
+    """Return indexed emails for the given ids, keeping the order of the ids."""
+    if not message_ids:
+        return []
+
+    placeholders = ','.join('?' * len(message_ids))
+    rows = conn.execute(
+        f"SELECT message_id, sender, subject, snippet, date, unread FROM emails "
+        f"WHERE message_id IN ({placeholders})",
+        list(message_ids)
+    ).fetchall()
+
+    by_id = {row[0]: _row_to_email(row) for row in rows}
+    return [by_id[message_id] for message_id in message_ids if message_id in by_id]
+
+
+def get_indexed_ids(conn, message_ids):
+    """Return the subset of message_ids that are already in the user's index."""
+    return {email['id'] for email in get_messages(conn, message_ids)}
@@ -1,5 +1,21 @@
 // src/hooks/useAudioRecorder.jsx
 import { useState, useRef, useCallback } from 'react';
+import gmailService from '../services/gmailService';
+
+// Turn search results into a short sentence the assistant can show or read out
+const describeSearchResults = (emails) => {
+  if (!emails || emails.length === 0) {
+    return "I couldn't find any matching emails.";
+  }
+  
+  const descriptions = emails.slice(0, 3).map(email => {
+    const sender = email.from.replace(/\s*<.*>$/, '');
+    return `"${email.subject || '(no subject)'}" from ${sender}`;
+  });
+  
+  const count = emails.length === 1 ? '1 email' : `${emails.length} emails`;
+  return `I found ${count}: ${descriptions.join('; ')}.`;
+};
 
 const useAudioRecorder = () => {
   const [isRecording, setIsRecording] = useState(false);
@@ -162,6 +178,10 @@ const useAudioRecorder = () => {
       if (data.intent === 'SUMMARIZE_EMAILS') {
         setTranscript('Getting your emails and ranking them by importance...');
         // TODO: Trigger email summarization flow
+      } else if (data.intent === 'SEARCH_EMAILS') {
+        setTranscript('Searching your emails...');
+        const results = await gmailService.searchEmails(data.search_query || data.original_command);
+        setTranscript(describeSearchResults(results.emails));
       } else {
         setTranscript(data.response);
       }